@@ -3,8 +3,13 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 from mqtt.mqtt_manager import mqtt_manager
+import logging
 import os
 
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 
@@ -40,7 +45,7 @@ async def publish_message(message: Message):
         "duration": message.duration
     }
     topic = message.topic
-    print("Received message:", topic)
+    logger.info("Received message: %s", topic)
     # 发布消息
     success = mqtt_manager.publish_message(msg_dict, topic)
     if success:
@@ -3,9 +3,14 @@ import ssl
 import random
 import time
 import json
+import logging
 import argparse
 from typing import Optional, Dict, Any
 
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
 CLIENT_ID = f"python-mqtt-pub-{random.randint(0, 4095)}"
 BROKER = "myggen.mooo.com"
 PORT = 8883
@@ -34,10 +39,10 @@ class MqttManager:
         try:
             def on_connect(_client, _userdata, _flags, return_code, _properties):
                 if return_code == 0:
-                    print("Connected to MQTT Broker!")
+                    logger.info("Connected to MQTT Broker!")
                     self.is_connected = True
                 else:
-                    print(f"Failed to connect, return code {return_code}")
+                    logger.error(f"Failed to connect, return code {return_code}")
                     self.is_connected = False
 
             self.client = mqtt_client.Client(
@@ -51,25 +56,25 @@ class MqttManager:
             self.client.loop_start()
             return True
         except Exception as e:
-            print(f"Connection error: {e}")
+            logger.error(f"Connection error: {e}")
             return False
 
     def publish_message(self, message: Dict[str, Any], topic: str = None) -> bool:
         if not self.is_connected or not self.client:
-            print("Not connected to MQTT broker")
+            logger.warning("Not connected to MQTT broker")
             return False
 
         try:
             used_topic = topic or self.topic
             result = self.client.publish(used_topic, json.dumps(message))
             if result.rc == 0:
-                print(f"Message published to {used_topic}")
+                logger.info(f"Message published to {used_topic}")
                 return True
             else:
-                print(f"Failed to publish message, return code: {result.rc}")
+                logger.error(f"Failed to publish message, return code: {result.rc}")
                 return False
         except Exception as e:
-            print(f"Publishing error: {e}")
+            logger.error(f"Publishing error: {e}")
             return False
 
     def disconnect(self):
@@ -77,7 +82,7 @@ class MqttManager:
             self.client.loop_stop()
             self.client.disconnect()
             self.is_connected = False
-            print("Disconnected from MQTT broker")
+            logger.info("Disconnected from MQTT broker")
 
 import os
 import argparse
@@ -111,7 +116,7 @@ try:
     }
     mqtt_manager.publish_message(test_message)
 except ValueError as e:
-    print(f"error: {e}")
+    logger.error(f"error: {e}")
 
 if __name__ == "__main__":
     try:
@@ -134,4 +139,4 @@ if __name__ == "__main__":
         
         fake_mqtt_manager.disconnect()
     except ValueError as e:
-        print(f"error: {e}")
\ No newline at end of file
+        logger.error(f"error: {e}")
\ No newline at end of file
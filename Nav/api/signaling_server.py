@@ -5,8 +5,9 @@ WebRTC Signaling Server
 """
 
 import asyncio
-import json
 import logging
+import os
+import orjson
 import websockets
 from typing import Dict, Any
 
@@ -14,37 +15,46 @@ from typing import Dict, Any
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 全局单例信令服务器
+# 写协程的攒批参数：窗口内的消息合并为一个 JSON 数组帧发送
+BATCH_WINDOW_MS = float(os.getenv("SIGNALING_BATCH_WINDOW_MS", "1"))
+BATCH_MAX = int(os.getenv("SIGNALING_BATCH_MAX", "64"))
+
+# 设备列表广播去抖窗口：窗口内的多次上下线只触发一次广播
+DEVICE_LIST_DEBOUNCE_S = 0.05
+
 class SignalingServer:
-    _instance = None
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.devices = {}
-            cls._instance.rooms = {}
-        return cls._instance
-    
     def __init__(self):
-        # 避免重复初始化
-        if hasattr(self, 'initialized'):
-            return
         self.devices = {}
         self.rooms = {}
-        self.initialized = True
+        # 通话配对：caller <-> callee，用于 O(1) 找到对端
+        self.pairs: Dict[str, str] = {}
+        # 每个设备一个发送队列 + 专属写协程，发送方只做 O(1) 入队
+        self.queues: Dict[str, asyncio.Queue] = {}
+        self.writers: Dict[str, asyncio.Task] = {}
+        # 缓存序列化后的设备列表，成员变化时失效
+        self._device_list_payload: bytes | None = None
+        # 去抖状态：脏标记 + 已排定的延迟广播
+        self._list_dirty = False
+        self._broadcast_handle = None
 
     async def register_device(self, websocket, device_id: str):
         """注册设备"""
+        # 重复注册（客户端重连）时先回收旧的写协程和队列
+        await self._cancel_writer(device_id)
         self.devices[device_id] = websocket
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1024)
+        self.queues[device_id] = queue
+        self.writers[device_id] = asyncio.create_task(self._writer_loop(websocket, queue))
+        self._device_list_payload = None
         logger.info(f"Device {device_id} connected. Total: {len(self.devices)}")
 
-        await websocket.send(json.dumps({
+        self._enqueue(device_id, orjson.dumps({
             "type": "registered",
             "device_id": device_id,
             "online_devices": list(self.devices.keys())
         }))
-        # 广播最新在线设备列表给其他设备
-        await self.broadcast_device_list(exclude=device_id)
+        # 广播最新在线设备列表（去抖合并连接风暴）
+        self.mark_device_list_dirty()
 
     async def unregister_device(self, device_id: str):
         """注销设备"""
@@ -52,51 +62,114 @@ class SignalingServer:
             del self.devices[device_id]
         if device_id in self.rooms:
             del self.rooms[device_id]
+        await self._cancel_writer(device_id)
+        peer = self.pairs.pop(device_id, None)
+        if peer and self.pairs.get(peer) == device_id:
+            del self.pairs[peer]
+        self._device_list_payload = None
         logger.info(f"Device {device_id} disconnected. Total: {len(self.devices)}")
         # 广播最新在线设备列表
-        await self.broadcast_device_list()
+        self.mark_device_list_dirty()
 
-    async def broadcast_device_list(self, exclude: str | None = None):
-        """广播所有在线设备列表给所有连接的客户端"""
-        payload = json.dumps({
-            "type": "device_list",
-            "online_devices": list(self.devices.keys())
-        })
-        for dev_id, ws in list(self.devices.items()):
-            if exclude and dev_id == exclude:
-                continue
+    async def _cancel_writer(self, device_id: str):
+        """取消并等待设备的写协程结束，确定性回收任务和队列引用"""
+        writer = self.writers.pop(device_id, None)
+        if writer:
+            writer.cancel()
             try:
-                await ws.send(payload)
-            except websockets.exceptions.ConnectionClosed:
+                await writer
+            except asyncio.CancelledError:
                 pass
+        self.queues.pop(device_id, None)
+
+    def mark_device_list_dirty(self):
+        """去抖：窗口内最多排定一次设备列表广播"""
+        self._list_dirty = True
+        if self._broadcast_handle is None:
+            loop = asyncio.get_running_loop()
+            self._broadcast_handle = loop.call_later(
+                DEVICE_LIST_DEBOUNCE_S, self._flush_device_list)
+
+    def _flush_device_list(self):
+        self._broadcast_handle = None
+        if self._list_dirty:
+            self._list_dirty = False
+            asyncio.create_task(self.broadcast_device_list())
+
+    async def broadcast_device_list(self, exclude: str | None = None):
+        """广播所有在线设备列表给所有连接的客户端"""
+        payload = self._device_list_payload
+        if payload is None:
+            # 懒计算一次，之后同一份 bytes 发给所有客户端
+            payload = self._device_list_payload = orjson.dumps({
+                "type": "device_list",
+                "online_devices": list(self.devices.keys())
+            })
+        if exclude:
+            websockets.broadcast(
+                [ws for dev_id, ws in self.devices.items() if dev_id != exclude],
+                payload)
+        else:
+            websockets.broadcast(self.devices.values(), payload)
+
+    def _enqueue(self, device_id: str, payload: bytes):
+        """O(1) 入队，由写协程负责实际发送"""
+        queue = self.queues.get(device_id)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # 慢消费者：丢弃本条消息而不是阻塞整个服务
+            logger.warning(f"Send queue full for {device_id}, dropping message")
+
+    async def _writer_loop(self, websocket, queue: asyncio.Queue):
+        """专属写协程：窗口内攒批，合并成一个 JSON 数组帧再发送"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch = [await queue.get()]
+                deadline = loop.time() + BATCH_WINDOW_MS / 1000.0
+                while len(batch) < BATCH_MAX and loop.time() < deadline:
+                    try:
+                        batch.append(queue.get_nowait())
+                    except asyncio.QueueEmpty:
+                        # 让出事件循环，给生产者一次入队机会
+                        await asyncio.sleep(0)
+                        if queue.empty():
+                            break
+                if len(batch) == 1:
+                    await websocket.send(batch[0])
+                else:
+                    # 客户端按 JSON 数组解析批量帧
+                    await websocket.send(b"[" + b",".join(batch) + b"]")
+        except websockets.exceptions.ConnectionClosed:
+            pass
 
     async def handle_call_request(self, from_device: str, to_device: str):
         """处理通话请求"""
         if to_device in self.devices:
-            target_websocket = self.devices[to_device]
-            await target_websocket.send(json.dumps({
+            self.pairs[from_device] = to_device
+            self.pairs[to_device] = from_device
+            self._enqueue(to_device, orjson.dumps({
                 "type": "incoming_call",
                 "from": from_device
             }))
             logger.info(f"Call request from {from_device} to {to_device}")
         else:
             if from_device in self.devices:
-                await self.devices[from_device].send(json.dumps({
+                self._enqueue(from_device, orjson.dumps({
                     "type": "call_failed",
                     "reason": "target_offline"
                 }))
 
     async def handle_call_response(self, from_device: str, response_type: str, to_device: str = None):
         """处理通话响应（接受/拒绝）"""
-        target_device = to_device
-        if not target_device:
-            for device_id in self.devices:
-                if device_id != from_device:
-                    target_device = device_id
-                    break
+        # 未指明对端时直接查配对表，O(1) 且结果确定
+        target_device = to_device or self.pairs.get(from_device)
 
         if target_device and target_device in self.devices:
-            await self.devices[target_device].send(json.dumps({
+            self._enqueue(target_device, orjson.dumps({
                 "type": response_type,
                 "from": from_device
             }))
@@ -106,18 +179,17 @@ class SignalingServer:
         """转发信令消息（offer, answer, ice_candidate）"""
         if to_device in self.devices:
             message["from"] = from_device
-            await self.devices[to_device].send(json.dumps(message))
+            self._enqueue(to_device, orjson.dumps(message))
             logger.info(f"Relayed {message['type']} from {from_device} to {to_device}")
 
     async def broadcast_to_others(self, from_device: str, message: dict):
         """广播消息给其他设备"""
         message["from"] = from_device
-        for device_id, websocket in self.devices.items():
-            if device_id != from_device:
-                try:
-                    await websocket.send(json.dumps(message))
-                except websockets.exceptions.ConnectionClosed:
-                    pass
+        # 序列化一次；broadcast 只组一次帧，同步写入各连接且自动跳过已关闭的
+        payload = orjson.dumps(message)
+        websockets.broadcast(
+            [ws for dev_id, ws in self.devices.items() if dev_id != from_device],
+            payload)
 
     async def handle_message(self, websocket, device_id: str, message: dict):
         """处理收到的消息"""
@@ -159,15 +231,19 @@ class SignalingServer:
             logger.warning(f"Unknown message type: {message_type}")
 
 
+# 全局唯一信令服务器实例
+SIGNALING = SignalingServer()
+
+
 async def handle_client(websocket):
     """处理客户端连接"""
     device_id = None
-    server = SignalingServer()
+    server = SIGNALING
 
     try:
         async for message in websocket:
             try:
-                data = json.loads(message)
+                data = orjson.loads(message)
 
                 if data.get("type") == "register":
                     device_id = data.get("device_id")
@@ -179,7 +255,7 @@ async def handle_client(websocket):
                     else:
                         logger.warning("Received message from unregistered device")
 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 logger.error("Invalid JSON received")
             except Exception as e:
                 logger.error(f"Error handling message: {e}")
@@ -201,10 +277,19 @@ async def main():
     
     logger.info(f"Starting WebRTC signaling server on {host}:{port}")
     
-    async with websockets.serve(handle_client, host, port):
+    # 信令消息都很小，关掉 permessage-deflate：
+    # 否则同一份广播 payload 会按接收方数量重复压缩
+    async with websockets.serve(handle_client, host, port, compression=None):
         await asyncio.Future()  # run forever
 
 if __name__ == "__main__":
+    # 纯 I/O 负载，优先使用 uvloop
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
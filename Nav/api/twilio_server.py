@@ -17,12 +17,15 @@ Environment variables required:
 """
 
 import os
-import json
+import time
 import asyncio
-from typing import Set
+import logging
+import weakref
+from functools import lru_cache
 from fastapi import FastAPI, Request, Body, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+import orjson
 from pydantic import BaseModel
 from twilio.jwt.access_token import AccessToken
 from twilio.jwt.access_token.grants import VoiceGrant
@@ -30,7 +33,11 @@ from twilio.rest import Client as TwilioRestClient
 from twilio.twiml.voice_response import VoiceResponse, Dial
 from dotenv import load_dotenv
 
-app = FastAPI()
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # CORS for local dev: allow web app on a different port to call these endpoints
 app.add_middleware(
@@ -43,8 +50,8 @@ app.add_middleware(
 
 load_dotenv()
 
-# WebSocket连接管理
-active_connections: Set[WebSocket] = set()
+# WebSocket连接管理（弱引用：断开的连接不会被集合钉在内存里）
+active_connections: "weakref.WeakSet[WebSocket]" = weakref.WeakSet()
 
 
 class BusySMSPayload(BaseModel):
@@ -59,6 +66,12 @@ def _env(key: str, required: bool = True, default: str | None = None) -> str:
     return val  # type: ignore
 
 
+@lru_cache(maxsize=1)
+def _twilio_client() -> TwilioRestClient:
+    """Lazily build one REST client and reuse its HTTP session/TLS context."""
+    return TwilioRestClient(_env("TWILIO_ACCOUNT_SID"), _env("TWILIO_AUTH_TOKEN"))
+
+
 @app.post("/twilio/voice", response_class=PlainTextResponse)
 async def twilio_voice_webhook(request: Request):
     """Incoming call webhook from Twilio -> return TwiML.
@@ -81,32 +94,58 @@ async def twilio_voice_webhook(request: Request):
 
 
 
+# identity -> (jwt, expiry timestamp); tokens are valid for _TOKEN_TTL seconds
+_TOKEN_TTL = 3600
+_TOKEN_CACHE_MAX = 4096
+_token_cache: dict[str, tuple[str, float]] = {}
+
+
+def _prune_token_cache(now: float):
+    """identity 由客户端任意指定，缓存必须有界：先清过期项，仍超限再淘汰最旧的"""
+    if len(_token_cache) < _TOKEN_CACHE_MAX:
+        return
+    for key in [k for k, (_, exp) in _token_cache.items() if exp - now <= 60]:
+        del _token_cache[key]
+    while len(_token_cache) >= _TOKEN_CACHE_MAX:
+        del _token_cache[next(iter(_token_cache))]
+
+
 @app.get("/twilio/token")
 async def twilio_token(identity: str | None = None):
     """Issue an access token for Twilio Voice JS SDK (web)."""
+    final_identity = identity or os.getenv("PUBLIC_CLIENT_IDENTITY", "visionnav_web")
+
+    # 同一 identity 在有效期内复用缓存的 JWT，避免每次请求都做 HMAC 签名
+    now = time.time()
+    cached = _token_cache.get(final_identity)
+    if cached and cached[1] - now > 60:
+        return {"identity": final_identity, "token": cached[0]}
+
     account_sid = _env("TWILIO_ACCOUNT_SID")
     api_key = _env("TWILIO_API_KEY_SID")
     api_secret = _env("TWILIO_API_KEY_SECRET")
     app_sid = _env("TWIML_APP_SID")
 
-    final_identity = identity or os.getenv("PUBLIC_CLIENT_IDENTITY", "visionnav_web")
-
-    token = AccessToken(account_sid, api_key, api_secret, identity=final_identity)
+    token = AccessToken(account_sid, api_key, api_secret,
+                        identity=final_identity, ttl=_TOKEN_TTL)
     voice_grant = VoiceGrant(outgoing_application_sid=app_sid, incoming_allow=True)
     token.add_grant(voice_grant)
 
-    return {"identity": final_identity, "token": token.to_jwt()}
+    jwt = token.to_jwt()
+    # 极少数并发重铸只是多签一次，结果等价，容忍竞态覆盖
+    _prune_token_cache(now)
+    _token_cache[final_identity] = (jwt, now + _TOKEN_TTL)
+    return {"identity": final_identity, "token": jwt}
 
 
 @app.post("/twilio/sms/busy")
 async def twilio_sms_busy(payload: BusySMSPayload):
     """Send 'I'm busy' SMS to a phone number via Twilio REST API."""
-    account_sid = _env("TWILIO_ACCOUNT_SID")
-    auth_token = _env("TWILIO_AUTH_TOKEN")
     from_number = _env("TWILIO_PHONE_NUMBER")
 
-    client = TwilioRestClient(account_sid, auth_token)
-    msg = client.messages.create(
+    # REST 调用是阻塞的，放到线程池里避免卡住事件循环
+    msg = await asyncio.to_thread(
+        _twilio_client().messages.create,
         to=payload.to,
         from_=from_number,
         body=payload.message or "I'm busy",
@@ -116,65 +155,71 @@ async def twilio_sms_busy(payload: BusySMSPayload):
 
 # ============ MOCK API FOR TESTING ============
 
-class MockIncomingCallPayload(BaseModel):
-    from_number: str = "+4552223460"  # Default to verified number
+DEFAULT_MOCK_FROM_NUMBER = "+4552223460"  # Default to verified number
 
 @app.websocket("/ws/mock")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for mock call triggers"""
     await websocket.accept()
     active_connections.add(websocket)
-    print(f"🔌 WebSocket connected. Total connections: {len(active_connections)}")
+    logger.info(f"🔌 WebSocket connected. Total connections: {len(active_connections)}")
     
     try:
         while True:
             # 保持连接活跃
             await websocket.receive_text()
     except WebSocketDisconnect:
-        active_connections.remove(websocket)
-        print(f"🔌 WebSocket disconnected. Total connections: {len(active_connections)}")
+        active_connections.discard(websocket)
+        logger.info(f"🔌 WebSocket disconnected. Total connections: {len(active_connections)}")
 
 async def broadcast_mock_call(from_number: str):
     """向所有连接的WebSocket客户端广播模拟来电"""
     message = {
         "type": "mock_incoming_call",
         "from_number": from_number,
-        "timestamp": int(asyncio.get_event_loop().time())
+        # time.monotonic() 是纯 C 调用，避免每次广播解析事件循环
+        "timestamp": int(time.monotonic())
     }
     
-    disconnected = set()
-    for connection in active_connections:
-        try:
-            await connection.send_text(json.dumps(message))
-            print(f"📡 Sent mock call to WebSocket client")
-        except:
-            disconnected.add(connection)
-    
-    # 清理断开的连接
-    for conn in disconnected:
-        active_connections.discard(conn)
+    # 序列化一次并发广播，慢连接不会阻塞其它客户端
+    payload = orjson.dumps(message).decode()
+    connections = list(active_connections)
+    results = await asyncio.gather(
+        *(conn.send_text(payload) for conn in connections),
+        return_exceptions=True
+    )
+    for conn, result in zip(connections, results):
+        if isinstance(result, Exception):
+            active_connections.discard(conn)
+        else:
+            logger.debug("📡 Sent mock call to WebSocket client")
 
 @app.post("/mock/trigger-incoming-call")
-async def mock_trigger_incoming_call(payload: MockIncomingCallPayload):
+async def mock_trigger_incoming_call(request: Request):
     """
     Trigger a mock incoming call via WebSocket to frontend.
-    
+
     Usage:
     POST /mock/trigger-incoming-call
     {
         "from_number": "+4552223460"  // Optional, defaults to verified number
     }
-    
+
     This will broadcast to all connected WebSocket clients.
     """
-    print(f"🎯 API: Triggering mock incoming call from {payload.from_number}")
-    
+    # 热路径直接读原始 body，跳过 pydantic 校验
+    body = await request.body()
+    data = orjson.loads(body) if body else {}
+    from_number = data.get("from_number") or DEFAULT_MOCK_FROM_NUMBER
+
+    logger.info(f"🎯 API: Triggering mock incoming call from {from_number}")
+
     # 通过WebSocket广播到所有连接的前端
-    await broadcast_mock_call(payload.from_number)
-    
+    await broadcast_mock_call(from_number)
+
     return {
         "success": True,
-        "from_number": payload.from_number,
+        "from_number": from_number,
         "message": "Mock incoming call broadcasted via WebSocket",
         "connected_clients": len(active_connections)
     }
@@ -182,5 +227,5 @@ async def mock_trigger_incoming_call(payload: MockIncomingCallPayload):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8005)
+    uvicorn.run(app, host="0.0.0.0", port=8005, loop="uvloop", http="httptools", ws="websockets")
 